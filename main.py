@@ -647,7 +647,8 @@ class Main(star.Star):
                 status_lines.append(f"• 活动窗口: {state.active_window_title or '未知'}")
                 status_lines.append(f"• 进程: {state.active_window_process or '未知'}")
                 if state.received_at:
-                    status_lines.append(f"• 最后更新: {state.received_at.strftime('%H:%M:%S')}")
+                    last_update = time.strftime("%H:%M:%S", time.localtime(state.received_at))
+                    status_lines.append(f"• 最后更新: {last_update}")
         
         yield event.plain_result("\n".join(status_lines))
 
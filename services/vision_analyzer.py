@@ -1,248 +1,430 @@
-"""
-视觉分析服务 - 使用多模态 LLM 分析桌面截图
-
-该服务封装了多模态 LLM 调用逻辑，用于分析截图内容并返回文本描述。
-支持三种识图模式：auto（自动检测）、chat（对话模型）、dedicated（独立模型）。
-"""
-
-import base64
-import os
-from typing import Optional
-from dataclasses import dataclass
-from enum import Enum
-
-from astrbot import logger
-
-
-class VisionMode(Enum):
-    """识图模式枚举"""
-    AUTO = "auto"           # 自动检测，优先对话模型，失败时提示配置
-    CHAT = "chat"           # 强制使用对话模型
-    DEDICATED = "dedicated" # 使用独立配置的识图模型
-
-
-@dataclass
-class VisionAnalysisResult:
-    """视觉分析结果"""
-    success: bool
-    description: str
-    image_path: Optional[str] = None
-    error_message: Optional[str] = None
-    
-    @classmethod
-    def error(cls, message: str) -> "VisionAnalysisResult":
-        """创建错误结果"""
-        return cls(success=False, description="", error_message=message)
-    
-    @classmethod
-    def success_result(cls, description: str, image_path: str) -> "VisionAnalysisResult":
-        """创建成功结果"""
-        return cls(success=True, description=description, image_path=image_path)
-
-
-class VisionAnalyzer:
-    """
-    视觉分析器 - 使用多模态 LLM 分析图片
-    
-    该类封装了调用多模态 LLM 分析图片的逻辑，
-    用于将截图转换为文本描述，供主 LLM 使用。
-    
-    支持三种识图模式：
-    - auto: 自动检测，优先尝试对话模型
-    - chat: 强制使用对话模型（需确保支持多模态）
-    - dedicated: 使用独立配置的多模态模型
-    """
-    
-    # 默认分析提示词
-    DEFAULT_ANALYSIS_PROMPT = """请分析这张桌面截图，描述以下内容：
-
-1. **当前活动**：用户正在进行什么操作？（如浏览网页、编写代码、看视频等）
-2. **打开的应用**：屏幕上可见哪些应用程序窗口？
-3. **屏幕布局**：窗口的大致布局是怎样的？
-4. **关键内容**：如果有明显的文字、图片或重要信息，请简要描述
-
-请用简洁的中文描述，不要过于详细，重点关注用户可能关心的内容。"""
-
-    def __init__(
-        self,
-        context,
-        vision_mode: str = "auto",
-        dedicated_provider_id: Optional[str] = None,
-    ):
-        """
-        初始化视觉分析器
-        
-        Args:
-            context: AstrBot 上下文对象，用于调用 LLM API
-            vision_mode: 识图模式，可选值: "auto" | "chat" | "dedicated"
-            dedicated_provider_id: 独立识图模型的 Provider ID（dedicated 模式必填）
-        """
-        self.context = context
-        
-        # 安全解析 vision_mode
-        try:
-            self.vision_mode = VisionMode(vision_mode)
-        except ValueError:
-            logger.warning(f"VisionAnalyzer: 无效的 vision_mode '{vision_mode}'，使用默认值 'auto'")
-            self.vision_mode = VisionMode.AUTO
-            
-        self.dedicated_provider_id = dedicated_provider_id
-        
-        # 配置验证
-        if self.vision_mode == VisionMode.DEDICATED and not dedicated_provider_id:
-            logger.warning(
-                "VisionAnalyzer: vision_mode 设置为 'dedicated'，"
-                "但未配置 dedicated_provider_id，将降级为 'auto' 模式"
-            )
-            self.vision_mode = VisionMode.AUTO
-            
-        logger.info(f"VisionAnalyzer 初始化完成: mode={self.vision_mode.value}, "
-                   f"dedicated_provider={dedicated_provider_id or '未配置'}")
-    
-    async def _get_vision_provider_id(self, umo: Optional[str] = None) -> tuple[Optional[str], bool]:
-        """
-        根据配置的识图模式获取实际使用的 Provider ID
-        
-        Args:
-            umo: unified_message_origin，用于获取会话关联的 provider
-        
-        Returns:
-            tuple[Optional[str], bool]: (provider_id, is_dedicated)
-            - provider_id: 实际使用的 Provider ID，可能为 None
-            - is_dedicated: 是否使用独立模型
-        """
-        if self.vision_mode == VisionMode.DEDICATED:
-            return self.dedicated_provider_id, True
-        
-        # AUTO 或 CHAT 模式：使用对话模型
-        try:
-            chat_provider_id = await self.context.get_current_chat_provider_id(umo)
-            return chat_provider_id, False
-        except Exception as e:
-            logger.error(f"获取对话模型 Provider ID 失败: {e}")
-            return None, False
-    
-    async def analyze_image(
-        self,
-        image_path: str,
-        prompt: Optional[str] = None,
-        provider_id: Optional[str] = None,
-        umo: Optional[str] = None,
-    ) -> VisionAnalysisResult:
-        """
-        分析图片内容
-        
-        Args:
-            image_path: 图片文件路径
-            prompt: 自定义分析提示词，如果为 None 则使用默认提示词
-            provider_id: 指定的 LLM provider ID（会覆盖 vision_mode 配置）
-            umo: unified_message_origin，用于获取会话关联的 provider
-        
-        Returns:
-            VisionAnalysisResult: 分析结果
-        """
-        # 检查文件是否存在
-        if not os.path.exists(image_path):
-            return VisionAnalysisResult.error(f"图片文件不存在: {image_path}")
-        
-        # 用于错误处理的标志
-        is_dedicated = False
-        
-        try:
-            # 确定使用的 Provider ID
-            if provider_id:
-                # 显式指定了 provider_id，直接使用
-                actual_provider_id = provider_id
-                is_dedicated = True
-            else:
-                # 根据 vision_mode 获取 provider_id
-                actual_provider_id, is_dedicated = await self._get_vision_provider_id(umo)
-            
-            if not actual_provider_id:
-                return VisionAnalysisResult.error(
-                    "无法获取识图模型 Provider ID，请检查配置"
-                )
-            
-            logger.info(f"使用 Provider '{actual_provider_id}' 进行视觉分析")
-            
-            # 使用自定义或默认提示词
-            analysis_prompt = prompt or self.DEFAULT_ANALYSIS_PROMPT
-            
-            # 调用多模态 LLM
-            llm_response = await self.context.llm_generate(
-                chat_provider_id=actual_provider_id,
-                prompt=analysis_prompt,
-                image_urls=[image_path],
-            )
-            
-            if llm_response and llm_response.completion_text:
-                return VisionAnalysisResult.success_result(
-                    description=llm_response.completion_text,
-                    image_path=image_path
-                )
-            else:
-                return VisionAnalysisResult.error("LLM 未返回有效的分析结果")
-                
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"视觉分析失败: {error_msg}")
-            
-            # AUTO 模式下，如果对话模型不支持多模态，提供友好提示
-            if self.vision_mode == VisionMode.AUTO and not is_dedicated:
-                error_lower = error_msg.lower()
-                if any(keyword in error_lower for keyword in ["image", "vision", "multimodal", "不支持"]):
-                    return VisionAnalysisResult.error(
-                        "当前对话模型不支持识图功能。\n"
-                        "解决方案：请在插件配置中设置 vision_mode 为 'dedicated'，"
-                        "并配置一个支持多模态的 LLM Provider（如 GPT-4o、Claude 3）"
-                    )
-            
-            return VisionAnalysisResult.error(f"分析过程出错: {error_msg}")
-    
-    async def analyze_desktop_screenshot(
-        self,
-        image_path: str,
-        umo: Optional[str] = None,
-    ) -> VisionAnalysisResult:
-        """
-        专门用于分析桌面截图的方法
-        
-        使用针对桌面截图优化的提示词进行分析。
-        
-        Args:
-            image_path: 截图文件路径
-            umo: unified_message_origin
-        
-        Returns:
-            VisionAnalysisResult: 分析结果
-        """
-        desktop_prompt = """你现在看到的是用户电脑桌面的实时截图。请简洁地描述：
-
-1. 用户当前在做什么？
-2. 屏幕上有哪些主要的应用或内容？
-3. 有什么值得注意的信息吗？
-
-请用口语化的方式回答，就像你真的能"看到"用户的屏幕一样。"""
-        
-        return await self.analyze_image(
-            image_path=image_path,
-            prompt=desktop_prompt,
-            umo=umo,
-        )
-    
-    def encode_image_base64(self, image_path: str) -> Optional[str]:
-        """
-        将图片编码为 base64 字符串
-        
-        Args:
-            image_path: 图片文件路径
-        
-        Returns:
-            base64 编码的图片字符串，失败返回 None
-        """
-        try:
-            with open(image_path, "rb") as f:
-                return base64.b64encode(f.read()).decode("utf-8")
-        except Exception as e:
-            logger.error(f"图片编码失败: {e}")
-            return None
+"""
+视觉分析服务 - 使用多模态 LLM 分析桌面截图
+
+该服务封装了多模态 LLM 调用逻辑，用于分析截图内容并返回文本描述。
+支持三种识图模式：auto（自动检测）、chat（对话模型）、dedicated（独立模型）。
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, Optional
+from dataclasses import dataclass
+from enum import Enum
+
+try:
+    import aiofiles
+    import aiofiles.os
+    AIOFILES_AVAILABLE = True
+except ImportError:
+    AIOFILES_AVAILABLE = False
+
+try:
+    # blake3（Rust + SIMD）哈希大图片比 blake2b 快数倍，且支持多线程（可选依赖）
+    import blake3
+
+    def _hash_image(data: bytes) -> str:
+        return blake3.blake3(data, max_threads=blake3.blake3.AUTO).hexdigest()
+
+except ImportError:
+    def _hash_image(data: bytes) -> str:
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+from astrbot import logger
+
+# 对话模型不支持多模态时的错误关键词（预编译，单次扫描即可匹配全部关键词）
+_UNSUPPORTED_VISION_RE = re.compile(r"image|vision|multimodal|不支持", re.IGNORECASE)
+
+
+class VisionMode(Enum):
+    """识图模式枚举"""
+    AUTO = "auto"           # 自动检测，优先对话模型，失败时提示配置
+    CHAT = "chat"           # 强制使用对话模型
+    DEDICATED = "dedicated" # 使用独立配置的识图模型
+
+
+@dataclass(frozen=True, slots=True)
+class VisionAnalysisResult:
+    """视觉分析结果"""
+    success: bool
+    description: str
+    image_path: Optional[str] = None
+    error_message: Optional[str] = None
+    
+    @classmethod
+    def error(cls, message: str) -> "VisionAnalysisResult":
+        """创建错误结果"""
+        return cls(success=False, description="", error_message=message)
+    
+    @classmethod
+    def success_result(cls, description: str, image_path: str) -> "VisionAnalysisResult":
+        """创建成功结果"""
+        return cls(success=True, description=description, image_path=image_path)
+
+
+class VisionAnalyzer:
+    """
+    视觉分析器 - 使用多模态 LLM 分析图片
+    
+    该类封装了调用多模态 LLM 分析图片的逻辑，
+    用于将截图转换为文本描述，供主 LLM 使用。
+    
+    支持三种识图模式：
+    - auto: 自动检测，优先尝试对话模型
+    - chat: 强制使用对话模型（需确保支持多模态）
+    - dedicated: 使用独立配置的多模态模型
+    """
+    
+    # 默认分析提示词
+    DEFAULT_ANALYSIS_PROMPT = """请分析这张桌面截图，描述以下内容：
+
+1. **当前活动**：用户正在进行什么操作？（如浏览网页、编写代码、看视频等）
+2. **打开的应用**：屏幕上可见哪些应用程序窗口？
+3. **屏幕布局**：窗口的大致布局是怎样的？
+4. **关键内容**：如果有明显的文字、图片或重要信息，请简要描述
+
+请用简洁的中文描述，不要过于详细，重点关注用户可能关心的内容。"""
+
+    # 桌面截图专用提示词（常量形式保证每次调用发送完全相同的前缀，
+    # 便于结果缓存命中，也有利于 Provider 侧的提示词缓存）
+    DESKTOP_SCREENSHOT_PROMPT = """你现在看到的是用户电脑桌面的实时截图。请简洁地描述：
+
+1. 用户当前在做什么？
+2. 屏幕上有哪些主要的应用或内容？
+3. 有什么值得注意的信息吗？
+
+请用口语化的方式回答，就像你真的能"看到"用户的屏幕一样。"""
+
+    # 分析结果缓存容量（按图片内容 + 提示词 + Provider 去重）
+    RESULT_CACHE_MAXSIZE = 64
+
+    # LLM 并发上限默认值（防止突发请求触发 Provider 限流）
+    DEFAULT_MAX_CONCURRENCY = 5
+
+    def __init__(
+        self,
+        context,
+        vision_mode: str = "auto",
+        dedicated_provider_id: Optional[str] = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    ):
+        """
+        初始化视觉分析器
+
+        Args:
+            context: AstrBot 上下文对象，用于调用 LLM API
+            vision_mode: 识图模式，可选值: "auto" | "chat" | "dedicated"
+            dedicated_provider_id: 独立识图模型的 Provider ID（dedicated 模式必填）
+            max_concurrency: 同时进行的 LLM 调用上限，默认 5
+        """
+        self.context = context
+        
+        # 安全解析 vision_mode
+        try:
+            self.vision_mode = VisionMode(vision_mode)
+        except ValueError:
+            logger.warning(f"VisionAnalyzer: 无效的 vision_mode '{vision_mode}'，使用默认值 'auto'")
+            self.vision_mode = VisionMode.AUTO
+            
+        self.dedicated_provider_id = dedicated_provider_id
+
+        # 分析结果 LRU 缓存：同一张截图 + 同一提示词 + 同一 Provider 的重复分析
+        # 直接命中缓存，省掉整个多模态 LLM 往返（桌面轮询时窗口未变化的场景很常见）
+        self._result_cache: "OrderedDict[str, VisionAnalysisResult]" = OrderedDict()
+        self._cache_lock = asyncio.Lock()
+
+        # 并发闸门：多个客户端同时触发截图分析时，限制同时打到
+        # Provider 的请求数，避免 429 限流引发的连锁重试
+        try:
+            max_concurrency = max(1, int(max_concurrency))
+        except (TypeError, ValueError):
+            logger.warning(f"VisionAnalyzer: 无效的 max_concurrency '{max_concurrency}'，使用默认值")
+            max_concurrency = self.DEFAULT_MAX_CONCURRENCY
+        self._sem = asyncio.Semaphore(max_concurrency)
+
+        # 进行中的分析请求: cache_key -> Future
+        # 短时间内对同一张截图的并发分析会合并为一次实际的 LLM 调用
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        # 配置验证
+        if self.vision_mode == VisionMode.DEDICATED and not dedicated_provider_id:
+            logger.warning(
+                "VisionAnalyzer: vision_mode 设置为 'dedicated'，"
+                "但未配置 dedicated_provider_id，将降级为 'auto' 模式"
+            )
+            self.vision_mode = VisionMode.AUTO
+            
+        logger.info(f"VisionAnalyzer 初始化完成: mode={self.vision_mode.value}, "
+                   f"dedicated_provider={dedicated_provider_id or '未配置'}")
+    
+    async def _get_vision_provider_id(self, umo: Optional[str] = None) -> tuple[Optional[str], bool]:
+        """
+        根据配置的识图模式获取实际使用的 Provider ID
+        
+        Args:
+            umo: unified_message_origin，用于获取会话关联的 provider
+        
+        Returns:
+            tuple[Optional[str], bool]: (provider_id, is_dedicated)
+            - provider_id: 实际使用的 Provider ID，可能为 None
+            - is_dedicated: 是否使用独立模型
+        """
+        if self.vision_mode == VisionMode.DEDICATED:
+            return self.dedicated_provider_id, True
+        
+        # AUTO 或 CHAT 模式：使用对话模型
+        try:
+            chat_provider_id = await self.context.get_current_chat_provider_id(umo)
+            return chat_provider_id, False
+        except Exception as e:
+            logger.error(f"获取对话模型 Provider ID 失败: {e}")
+            return None, False
+    
+    @staticmethod
+    async def _path_exists(path: str) -> bool:
+        """异步检查文件是否存在，不阻塞事件循环"""
+        if AIOFILES_AVAILABLE:
+            return await aiofiles.os.path.exists(path)
+        return await asyncio.to_thread(os.path.exists, path)
+
+    @staticmethod
+    async def _read_bytes(path: str) -> bytes:
+        """异步读取文件内容，不阻塞事件循环"""
+        if AIOFILES_AVAILABLE:
+            async with aiofiles.open(path, "rb") as f:
+                return await f.read()
+
+        def _read() -> bytes:
+            with open(path, "rb") as f:
+                return f.read()
+
+        return await asyncio.to_thread(_read)
+
+    @staticmethod
+    def _make_cache_key(image_bytes: bytes, prompt: str, provider_id: str) -> str:
+        """
+        计算分析结果的缓存键
+
+        使用图片内容哈希（而非文件路径）作为键的一部分，
+        保证同一张截图保存为不同文件时也能命中缓存。
+        """
+        image_digest = _hash_image(image_bytes)
+        return f"{image_digest}:{hash(prompt)}:{provider_id}"
+
+    async def _cache_get(self, key: str) -> Optional[VisionAnalysisResult]:
+        """读取缓存中的分析结果（命中时移动到 LRU 末尾）"""
+        async with self._cache_lock:
+            result = self._result_cache.get(key)
+            if result is not None:
+                self._result_cache.move_to_end(key)
+            return result
+
+    async def _cache_put(self, key: str, result: VisionAnalysisResult):
+        """写入缓存并按 LRU 策略淘汰最旧条目"""
+        async with self._cache_lock:
+            self._result_cache[key] = result
+            self._result_cache.move_to_end(key)
+            while len(self._result_cache) > self.RESULT_CACHE_MAXSIZE:
+                self._result_cache.popitem(last=False)
+
+    async def analyze_image(
+        self,
+        image_path: str,
+        prompt: Optional[str] = None,
+        provider_id: Optional[str] = None,
+        umo: Optional[str] = None,
+    ) -> VisionAnalysisResult:
+        """
+        分析图片内容
+        
+        Args:
+            image_path: 图片文件路径
+            prompt: 自定义分析提示词，如果为 None 则使用默认提示词
+            provider_id: 指定的 LLM provider ID（会覆盖 vision_mode 配置）
+            umo: unified_message_origin，用于获取会话关联的 provider
+        
+        Returns:
+            VisionAnalysisResult: 分析结果
+        """
+        # 检查文件是否存在（异步，不阻塞事件循环）
+        if not await self._path_exists(image_path):
+            return VisionAnalysisResult.error(f"图片文件不存在: {image_path}")
+
+        # 确定使用的 Provider ID
+        if provider_id:
+            # 显式指定了 provider_id，直接使用
+            actual_provider_id = provider_id
+            is_dedicated = True
+        else:
+            # 根据 vision_mode 获取 provider_id
+            actual_provider_id, is_dedicated = await self._get_vision_provider_id(umo)
+
+        if not actual_provider_id:
+            return VisionAnalysisResult.error(
+                "无法获取识图模型 Provider ID，请检查配置"
+            )
+
+        # 使用自定义或默认提示词
+        analysis_prompt = prompt or self.DEFAULT_ANALYSIS_PROMPT
+
+        # 检查结果缓存：同一张截图的重复分析直接返回，省掉 LLM 往返
+        cache_key = None
+        try:
+            image_bytes = await self._read_bytes(image_path)
+            cache_key = self._make_cache_key(
+                image_bytes, analysis_prompt, actual_provider_id
+            )
+        except OSError as e:
+            logger.debug(f"读取图片用于缓存键失败，跳过缓存: {e}")
+
+        inflight: Optional[asyncio.Future] = None
+        if cache_key:
+            cached = await self._cache_get(cache_key)
+            if cached is not None:
+                logger.debug(f"视觉分析命中缓存: {image_path}")
+                return cached
+
+            # 合并进行中的相同请求：并发的重复分析共享一次实际 LLM 调用
+            existing = self._inflight.get(cache_key)
+            if existing is not None:
+                logger.debug(f"视觉分析合并到进行中的相同请求: {image_path}")
+                return await asyncio.shield(existing)
+
+            inflight = asyncio.get_running_loop().create_future()
+            self._inflight[cache_key] = inflight
+
+        try:
+            result = await self._do_analyze(
+                image_path, analysis_prompt, actual_provider_id, is_dedicated
+            )
+            # 仅缓存成功结果，失败结果应重新尝试
+            if result.success and cache_key:
+                await self._cache_put(cache_key, result)
+            if inflight is not None and not inflight.done():
+                inflight.set_result(result)
+            return result
+        finally:
+            if cache_key:
+                self._inflight.pop(cache_key, None)
+            if inflight is not None and not inflight.done():
+                # 取消等异常路径：让合并进来的等待者也拿到结果
+                inflight.set_result(VisionAnalysisResult.error("分析请求被中断"))
+
+    async def _do_analyze(
+        self,
+        image_path: str,
+        analysis_prompt: str,
+        actual_provider_id: str,
+        is_dedicated: bool,
+    ) -> VisionAnalysisResult:
+        """执行单次实际的 LLM 视觉分析（不经过缓存与请求合并）"""
+        try:
+            logger.info(f"使用 Provider '{actual_provider_id}' 进行视觉分析")
+
+            # 调用多模态 LLM（信号量限制并发，避免突发请求打满 Provider）
+            async with self._sem:
+                llm_response = await self.context.llm_generate(
+                    chat_provider_id=actual_provider_id,
+                    prompt=analysis_prompt,
+                    image_urls=[image_path],
+                )
+
+            if llm_response and llm_response.completion_text:
+                return VisionAnalysisResult.success_result(
+                    description=llm_response.completion_text,
+                    image_path=image_path
+                )
+            else:
+                return VisionAnalysisResult.error("LLM 未返回有效的分析结果")
+
+        except Exception as e:
+            error_msg = str(e)
+            logger.error(f"视觉分析失败: {error_msg}")
+            
+            # AUTO 模式下，如果对话模型不支持多模态，提供友好提示
+            if self.vision_mode == VisionMode.AUTO and not is_dedicated:
+                if _UNSUPPORTED_VISION_RE.search(error_msg):
+                    return VisionAnalysisResult.error(
+                        "当前对话模型不支持识图功能。\n"
+                        "解决方案：请在插件配置中设置 vision_mode 为 'dedicated'，"
+                        "并配置一个支持多模态的 LLM Provider（如 GPT-4o、Claude 3）"
+                    )
+            
+            return VisionAnalysisResult.error(f"分析过程出错: {error_msg}")
+    
+    async def analyze_images_batch(
+        self,
+        image_paths: list,
+        prompt: Optional[str] = None,
+        provider_id: Optional[str] = None,
+        umo: Optional[str] = None,
+    ) -> list:
+        """
+        并发分析多张图片
+
+        各个分析任务并发执行，内部信号量会自动将同时进行的
+        LLM 调用限制在 max_concurrency 以内。
+
+        Args:
+            image_paths: 图片文件路径列表
+            prompt: 自定义分析提示词，如果为 None 则使用默认提示词
+            provider_id: 指定的 LLM provider ID（会覆盖 vision_mode 配置）
+            umo: unified_message_origin
+
+        Returns:
+            list[VisionAnalysisResult]: 与 image_paths 顺序一致的分析结果列表
+        """
+        return await asyncio.gather(*(
+            self.analyze_image(
+                image_path=path,
+                prompt=prompt,
+                provider_id=provider_id,
+                umo=umo,
+            )
+            for path in image_paths
+        ))
+
+    async def analyze_desktop_screenshot(
+        self,
+        image_path: str,
+        umo: Optional[str] = None,
+    ) -> VisionAnalysisResult:
+        """
+        专门用于分析桌面截图的方法
+        
+        使用针对桌面截图优化的提示词进行分析。
+        
+        Args:
+            image_path: 截图文件路径
+            umo: unified_message_origin
+        
+        Returns:
+            VisionAnalysisResult: 分析结果
+        """
+        return await self.analyze_image(
+            image_path=image_path,
+            prompt=self.DESKTOP_SCREENSHOT_PROMPT,
+            umo=umo,
+        )
+    
+    async def encode_image_base64(self, image_path: str) -> Optional[str]:
+        """
+        将图片编码为 base64 字符串
+
+        文件读取为异步操作，不阻塞事件循环。
+
+        Args:
+            image_path: 图片文件路径
+
+        Returns:
+            base64 编码的图片字符串，失败返回 None
+        """
+        try:
+            data = await self._read_bytes(image_path)
+            return base64.b64encode(data).decode("utf-8")
+        except Exception as e:
+            logger.error(f"图片编码失败: {e}")
+            return None
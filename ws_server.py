@@ -1,59 +1,141 @@
-"""
-独立 WebSocket 服务器模块
-
-使用 websockets 库创建独立的 WebSocket 服务器，监听端口 6190。
-这个方案不依赖 AstrBot 主应用，避免了框架兼容性问题。
-
-桌面客户端连接地址: ws://服务器IP:6190
-"""
-
-import asyncio
-import json
-import traceback
-from typing import Optional, Callable, Any, Dict, Set
-from urllib.parse import parse_qs, urlparse
-
-try:
-    import websockets
-    from websockets.server import serve, WebSocketServerProtocol
-    from websockets.exceptions import ConnectionClosed
-    WEBSOCKETS_AVAILABLE = True
-except ImportError:
-    WEBSOCKETS_AVAILABLE = False
-    WebSocketServerProtocol = None
-
-from astrbot.api import logger
-
-
+"""
+独立 WebSocket 服务器模块
+
+使用 websockets 库创建独立的 WebSocket 服务器，监听端口 6190。
+这个方案不依赖 AstrBot 主应用，避免了框架兼容性问题。
+
+桌面客户端连接地址: ws://服务器IP:6190
+"""
+
+import asyncio
+import heapq
+import json
+import logging
+import time
+import traceback
+from typing import Optional, Callable, Any, Dict, Set
+from urllib.parse import parse_qsl, urlsplit
+
+try:
+    import websockets
+    from websockets.server import serve, WebSocketServerProtocol
+    from websockets.exceptions import ConnectionClosed
+    WEBSOCKETS_AVAILABLE = True
+    # websockets>=10 自带的同步扇出入口，专为广播设计
+    _ws_broadcast = getattr(websockets, "broadcast", None)
+except ImportError:
+    WEBSOCKETS_AVAILABLE = False
+    WebSocketServerProtocol = None
+    _ws_broadcast = None
+
+try:
+    # orjson（Rust 实现）解析/序列化大 JSON 比标准库快数倍（可选依赖）
+    import orjson
+
+    def _json_loads(data):
+        return orjson.loads(data)
+
+    def _json_dumps(data) -> str:
+        # 解码为 str 以保持文本帧协议，客户端无需感知序列化器变化
+        return orjson.dumps(data).decode("utf-8")
+
+except ImportError:
+    def _json_loads(data):
+        return json.loads(data)
+
+    def _json_dumps(data) -> str:
+        # 紧凑分隔符与 orjson 输出一致，心跳/广播载荷少几个字节
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+from astrbot.api import logger
+
+# 允许的连接路径（/ws/client 为标准路径，根路径为兼容旧客户端）
+_VALID_PATHS = frozenset({"/ws/client", "/", ""})
+
+
+def _as_async_dispatcher(callback: Optional[Callable]) -> Optional[Callable]:
+    """
+    注册时一次性判断回调是同步还是协程函数，返回统一的异步派发器
+
+    调用点只需 await，不用在每条消息上重复 iscoroutine 类型检查。
+    """
+    if callback is None:
+        return None
+    if asyncio.iscoroutinefunction(callback):
+        return callback
+
+    async def _dispatch(*args, _cb=callback):
+        return _cb(*args)
+
+    return _dispatch
+
+
+class _ClientState:
+    """
+    单个客户端连接的全部运行时状态
+
+    连接、活跃时间、心跳计数、忙碌状态、发送队列集中在一个对象里，
+    每条消息只需一次字典查找；__slots__ 避免为每个连接创建实例 __dict__。
+    """
+
+    __slots__ = (
+        "websocket",
+        "last_activity",
+        "heartbeat_count",
+        "busy_until",
+        "epoch",
+        "out_queue",
+        "writer_task",
+    )
+
+    def __init__(
+        self,
+        websocket: WebSocketServerProtocol,
+        out_queue: asyncio.Queue,
+        writer_task: asyncio.Task,
+    ):
+        self.websocket = websocket
+        self.last_activity: float = time.monotonic()
+        self.heartbeat_count: int = 0
+        self.busy_until: float = 0.0
+        # 活跃纪元：每次活跃递增，用于使到期堆中的旧条目失效
+        self.epoch: int = 0
+        self.out_queue: Optional[asyncio.Queue] = out_queue
+        self.writer_task: Optional[asyncio.Task] = writer_task
+
+
 class StandaloneWebSocketServer:
-    """
-    独立 WebSocket 服务器
-    
-    使用 websockets 库在指定端口运行，不依赖 AstrBot 主应用。
-    支持客户端认证、心跳检测、消息分发等功能。
-    
-    稳定性增强（参考 Satori 适配器的成功模式）：
-    - 主动健康检查：每 20 秒检测所有连接是否存活
-    - 服务端主动探测：定期发送 server_ping 探测客户端
-    - 死连接清理：自动清理超时未响应的连接
-    - 连接状态广播：主动通知客户端连接状态
-    - 忙碌状态支持：客户端可报告忙碌状态，暂时延长超时
-    """
-    
-    # 心跳配置常量 - 优化稳定性：PING_TIMEOUT 必须大于 PING_INTERVAL
-    PING_INTERVAL = 20  # WebSocket 底层心跳间隔（秒）
-    PING_TIMEOUT = 40   # WebSocket 底层心跳超时（秒）- 必须大于 PING_INTERVAL 的 2 倍
-    
-    # 健康检查配置 - 更频繁的检查
-    HEALTH_CHECK_INTERVAL = 20  # 健康检查间隔（秒）- 从 60 秒降到 20 秒
-    CLIENT_INACTIVE_TIMEOUT = 60  # 客户端不活跃超时（秒）- 从 120 秒降到 60 秒
-    
-    # 服务端主动探测配置
-    SERVER_PING_INTERVAL = 15  # 服务端主动 ping 间隔（秒）
-    
-    # 忙碌状态超时延长
-    BUSY_STATE_TIMEOUT_EXTENSION = 120  # 忙碌状态下的超时延长（秒）
-    
+    """
+    独立 WebSocket 服务器
+    
+    使用 websockets 库在指定端口运行，不依赖 AstrBot 主应用。
+    支持客户端认证、心跳检测、消息分发等功能。
+    
+    稳定性增强（参考 Satori 适配器的成功模式）：
+    - 主动健康检查：每 20 秒检测所有连接是否存活
+    - 服务端主动探测：定期发送 server_ping 探测客户端
+    - 死连接清理：自动清理超时未响应的连接
+    - 连接状态广播：主动通知客户端连接状态
+    - 忙碌状态支持：客户端可报告忙碌状态，暂时延长超时
+    """
+    
+    # 心跳配置常量 - 优化稳定性：PING_TIMEOUT 必须大于 PING_INTERVAL
+    PING_INTERVAL = 20  # WebSocket 底层心跳间隔（秒）
+    PING_TIMEOUT = 40   # WebSocket 底层心跳超时（秒）- 必须大于 PING_INTERVAL 的 2 倍
+    
+    # 健康检查配置 - 更频繁的检查
+    HEALTH_CHECK_INTERVAL = 20  # 健康检查间隔（秒）- 从 60 秒降到 20 秒
+    CLIENT_INACTIVE_TIMEOUT = 60  # 客户端不活跃超时（秒）- 从 120 秒降到 60 秒
+    
+    # 服务端主动探测配置
+    SERVER_PING_INTERVAL = 15  # 服务端主动 ping 间隔（秒）
+    
+    # 忙碌状态超时延长
+    BUSY_STATE_TIMEOUT_EXTENSION = 120  # 忙碌状态下的超时延长（秒）
+
+    # 每个客户端的发送队列容量 - 队列满说明客户端消费过慢，丢弃最旧消息
+    SEND_QUEUE_MAXSIZE = 256
+    
     def __init__(
         self,
         host: str = "0.0.0.0",
@@ -63,202 +145,224 @@ class StandaloneWebSocketServer:
         on_message: Optional[Callable[[str, dict], Any]] = None,
         token_validator: Optional[Callable[[str], bool]] = None,
     ):
-        """
-        初始化 WebSocket 服务器
-        
-        Args:
-            host: 监听地址，默认 0.0.0.0（所有网卡）
-            port: 监听端口，默认 6190
-            on_client_connect: 客户端连接回调
-            on_client_disconnect: 客户端断开回调
-            on_message: 消息接收回调
-        """
-        self.host = host
-        self.port = port
+        """
+        初始化 WebSocket 服务器
+        
+        Args:
+            host: 监听地址，默认 0.0.0.0（所有网卡）
+            port: 监听端口，默认 6190
+            on_client_connect: 客户端连接回调
+            on_client_disconnect: 客户端断开回调
+            on_message: 消息接收回调
+        """
+        self.host = host
+        self.port = port
         self.on_client_connect = on_client_connect
         self.on_client_disconnect = on_client_disconnect
         self.on_message = on_message
         self._token_validator = token_validator
-        
-        # 活跃连接: session_id -> websocket
-        self.connections: Dict[str, WebSocketServerProtocol] = {}
-        
-        # 客户端最后活跃时间: session_id -> timestamp
-        self._last_activity: Dict[str, float] = {}
-        
-        # 客户端心跳计数: session_id -> count
-        self._heartbeat_counts: Dict[str, int] = {}
-        
-        # 服务器状态
-        self._server = None
-        self._running = False
-        self._server_task: Optional[asyncio.Task] = None
-        self._health_check_task: Optional[asyncio.Task] = None
-        self._server_ping_task: Optional[asyncio.Task] = None  # 服务端主动探测任务
-        
-        # 客户端忙碌状态: session_id -> busy_until_timestamp
-        self._busy_states: Dict[str, float] = {}
-        
-        # 统计信息
-        self._total_connections: int = 0
-        self._total_messages: int = 0
-        self._total_disconnections: int = 0
-        self._total_server_pings: int = 0  # 服务端发送的 ping 总数
-        self._total_server_pongs: int = 0  # 收到的 pong 响应总数
-        
-    @property
-    def is_running(self) -> bool:
-        """服务器是否正在运行"""
-        return self._running and self._server is not None
-    
-    def get_connected_client_ids(self) -> list:
-        """获取所有已连接客户端的 session_id"""
-        return list(self.connections.keys())
-    
-    def get_active_clients_count(self) -> int:
-        """获取活跃客户端数量"""
-        return len(self.connections)
-    
-    async def start(self):
-        """启动 WebSocket 服务器"""
-        if not WEBSOCKETS_AVAILABLE:
-            logger.error("❌ websockets 库未安装，无法启动 WebSocket 服务器")
-            logger.error("   请运行: pip install websockets>=12.0")
-            return False
-        
-        if self._running:
-            logger.warning("WebSocket 服务器已在运行中")
-            return True
-        
-        try:
-            # 创建服务器 - 心跳参数与客户端保持一致
-            # max_size 设置为 50MB，支持高分辨率截图传输
-            self._server = await serve(
-                self._handle_connection,
-                self.host,
-                self.port,
-                ping_interval=self.PING_INTERVAL,  # 心跳间隔 20 秒
-                ping_timeout=self.PING_TIMEOUT,    # 心跳超时 40 秒（增加容错）
-                close_timeout=10,                   # 关闭超时 10 秒
-                max_size=50 * 1024 * 1024,         # 最大消息大小 50MB（支持高分辨率截图）
-                compression=None,                   # 禁用压缩以减少 CPU 开销
-            )
-            
-            self._running = True
-            
-            # 启动健康检查任务
-            self._health_check_task = asyncio.create_task(self._health_check_loop())
-            
-            # 启动服务端主动探测任务
-            self._server_ping_task = asyncio.create_task(self._server_ping_loop())
-            
-            logger.info("=" * 60)
-            logger.info("✅ WebSocket 服务器启动成功！（稳定性增强版）")
-            logger.info(f"   监听地址: {self.host}:{self.port}")
-            logger.info(f"   桌面客户端连接地址: ws://服务器IP:{self.port}")
-            logger.info(f"   WebSocket 心跳间隔: {self.PING_INTERVAL}s")
-            logger.info(f"   健康检查间隔: {self.HEALTH_CHECK_INTERVAL}s")
-            logger.info(f"   服务端探测间隔: {self.SERVER_PING_INTERVAL}s")
-            logger.info(f"   客户端超时时间: {self.CLIENT_INACTIVE_TIMEOUT}s")
-            logger.info(f"   最大消息大小: 50MB（支持高分辨率截图）")
-            logger.info("=" * 60)
-            
-            return True
-            
-        except OSError as e:
-            if "address already in use" in str(e).lower() or e.errno == 10048:
-                logger.error(f"❌ 端口 {self.port} 已被占用！")
-                logger.error("   请检查是否有其他程序占用该端口，或修改配置使用其他端口")
-            else:
-                logger.error(f"❌ WebSocket 服务器启动失败: {e}")
-            return False
-        except Exception as e:
-            logger.error(f"❌ WebSocket 服务器启动失败: {e}")
-            logger.error(traceback.format_exc())
-            return False
-    
-    async def stop(self):
-        """停止 WebSocket 服务器"""
-        if not self._running:
-            return
-        
-        self._running = False
-        
-        # 停止健康检查任务
-        if self._health_check_task:
-            self._health_check_task.cancel()
-            try:
-                await self._health_check_task
-            except asyncio.CancelledError:
-                pass
-            self._health_check_task = None
-        
-        # 停止服务端主动探测任务
-        if self._server_ping_task:
-            self._server_ping_task.cancel()
-            try:
-                await self._server_ping_task
-            except asyncio.CancelledError:
-                pass
-            self._server_ping_task = None
-        
-        # 关闭所有连接（发送关闭通知）
-        for session_id, ws in list(self.connections.items()):
-            try:
-                # 先发送关闭通知
-                await self._send_json(ws, {
-                    "type": "server_closing",
-                    "message": "Server shutting down"
-                })
-                await ws.close(1001, "Server shutting down")
-            except Exception:
-                pass
-        self.connections.clear()
-        self._last_activity.clear()
-        self._heartbeat_counts.clear()
-        self._busy_states.clear()
-        
-        # 关闭服务器
-        if self._server:
-            self._server.close()
-            await self._server.wait_closed()
-            self._server = None
-        
-        logger.info("WebSocket 服务器已停止")
-    
-    async def _handle_connection(self, websocket: WebSocketServerProtocol):
-        """
-        处理 WebSocket 连接
-        
-        支持两种连接方式：
-        1. ws://服务器IP:6190/ws/client?session_id=xxx&token=xxx (标准路径)
-        2. ws://服务器IP:6190?session_id=xxx&token=xxx (根路径兼容)
-        """
-        # 解析 URL 路径和参数
-        full_path = websocket.path if hasattr(websocket, 'path') else "/"
-        
-        # 分离路径和查询参数
-        if "?" in full_path:
-            path_part, query_string = full_path.split("?", 1)
-        else:
-            path_part = full_path
-            query_string = ""
-        
-        params = parse_qs(query_string)
-        
-        # 验证路径（支持 /ws/client 和 / 两种路径）
-        valid_paths = ["/ws/client", "/", ""]
-        if path_part not in valid_paths:
-            logger.warning(f"WebSocket 连接拒绝: 无效路径 '{path_part}'，支持的路径: {valid_paths}")
-            await websocket.close(1008, f"Invalid path: {path_part}")
-            return
-        
-        session_id = params.get("session_id", [None])[0]
-        token = params.get("token", [None])[0]
-        
-        logger.info(f"收到 WebSocket 连接请求: path={path_part}, session_id={session_id}, token={'*' * 6 if token else 'None'}")
-        
-        # 验证参数
+
+        # 回调在注册时包装为统一的异步派发器（见 _as_async_dispatcher）
+        self._dispatch_connect = _as_async_dispatcher(on_client_connect)
+        self._dispatch_disconnect = _as_async_dispatcher(on_client_disconnect)
+        self._dispatch_message = _as_async_dispatcher(on_message)
+        
+        # 客户端状态集中存储: session_id -> _ClientState
+        # 出站消息经状态里的队列由专属写任务发送，慢客户端不会阻塞接收循环
+        self._clients: Dict[str, _ClientState] = {}
+
+        # 到期最小堆: (deadline, session_id, epoch)
+        # 客户端活跃时只压入新条目（懒删除），健康检查按 epoch 跳过失效条目，
+        # 超时检测开销与实际到期数成正比，而不是与连接数成正比
+        self._expiry_heap: list = []
+        
+        # 服务器状态
+        self._server = None
+        self._running = False
+        self._server_task: Optional[asyncio.Task] = None
+        self._health_check_task: Optional[asyncio.Task] = None
+        self._server_ping_task: Optional[asyncio.Task] = None  # 服务端主动探测任务
+        
+        # 统计信息
+        self._total_connections: int = 0
+        self._total_messages: int = 0
+        self._total_disconnections: int = 0
+        self._total_server_pings: int = 0  # 服务端发送的 ping 总数
+        self._total_server_pongs: int = 0  # 收到的 pong 响应总数
+        
+    @property
+    def is_running(self) -> bool:
+        """服务器是否正在运行"""
+        return self._running and self._server is not None
+
+    @property
+    def connections(self) -> Dict[str, WebSocketServerProtocol]:
+        """兼容视图: session_id -> websocket（按需构建，内部请直接用 _clients）"""
+        return {sid: state.websocket for sid, state in self._clients.items()}
+    
+    def get_connected_client_ids(self) -> list:
+        """获取所有已连接客户端的 session_id"""
+        return list(self._clients.keys())
+    
+    def get_active_clients_count(self) -> int:
+        """获取活跃客户端数量"""
+        return len(self._clients)
+    
+    async def start(self):
+        """启动 WebSocket 服务器"""
+        if not WEBSOCKETS_AVAILABLE:
+            logger.error("❌ websockets 库未安装，无法启动 WebSocket 服务器")
+            logger.error("   请运行: pip install websockets>=12.0")
+            return False
+        
+        if self._running:
+            logger.warning("WebSocket 服务器已在运行中")
+            return True
+        
+        try:
+            # 创建服务器 - 心跳参数与客户端保持一致
+            # max_size 设置为 50MB，支持高分辨率截图传输
+            self._server = await serve(
+                self._handle_connection,
+                self.host,
+                self.port,
+                ping_interval=self.PING_INTERVAL,  # 心跳间隔 20 秒
+                ping_timeout=self.PING_TIMEOUT,    # 心跳超时 40 秒（增加容错）
+                close_timeout=10,                   # 关闭超时 10 秒
+                max_size=50 * 1024 * 1024,         # 最大消息大小 50MB（支持高分辨率截图）
+                compression=None,                   # 禁用压缩以减少 CPU 开销
+            )
+            
+            self._running = True
+
+            # 事件循环由 AstrBot 宿主创建，插件内无法再切换 uvloop；
+            # 记录实际实现，便于运维确认宿主是否启用了 uvloop 加速
+            loop_cls = type(asyncio.get_running_loop())
+            logger.debug(f"事件循环实现: {loop_cls.__module__}.{loop_cls.__name__}")
+            
+            # 启动健康检查任务
+            self._health_check_task = asyncio.create_task(self._health_check_loop())
+            
+            # 启动服务端主动探测任务
+            self._server_ping_task = asyncio.create_task(self._server_ping_loop())
+            
+            logger.info("=" * 60)
+            logger.info("✅ WebSocket 服务器启动成功！（稳定性增强版）")
+            logger.info(f"   监听地址: {self.host}:{self.port}")
+            logger.info(f"   桌面客户端连接地址: ws://服务器IP:{self.port}")
+            logger.info(f"   WebSocket 心跳间隔: {self.PING_INTERVAL}s")
+            logger.info(f"   健康检查间隔: {self.HEALTH_CHECK_INTERVAL}s")
+            logger.info(f"   服务端探测间隔: {self.SERVER_PING_INTERVAL}s")
+            logger.info(f"   客户端超时时间: {self.CLIENT_INACTIVE_TIMEOUT}s")
+            logger.info(f"   最大消息大小: 50MB（支持高分辨率截图）")
+            logger.info("=" * 60)
+            
+            return True
+            
+        except OSError as e:
+            if "address already in use" in str(e).lower() or e.errno == 10048:
+                logger.error(f"❌ 端口 {self.port} 已被占用！")
+                logger.error("   请检查是否有其他程序占用该端口，或修改配置使用其他端口")
+            else:
+                logger.error(f"❌ WebSocket 服务器启动失败: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"❌ WebSocket 服务器启动失败: {e}")
+            logger.error(traceback.format_exc())
+            return False
+    
+    async def stop(self):
+        """停止 WebSocket 服务器"""
+        if not self._running:
+            return
+        
+        self._running = False
+        
+        # 停止健康检查任务
+        if self._health_check_task:
+            self._health_check_task.cancel()
+            try:
+                await self._health_check_task
+            except asyncio.CancelledError:
+                pass
+            self._health_check_task = None
+        
+        # 停止服务端主动探测任务
+        if self._server_ping_task:
+            self._server_ping_task.cancel()
+            try:
+                await self._server_ping_task
+            except asyncio.CancelledError:
+                pass
+            self._server_ping_task = None
+        
+        # 停止所有写任务
+        for session_id in list(self._clients.keys()):
+            self._teardown_writer(session_id)
+
+        # 并行关闭所有连接：逐个 await 时总耗时最坏为 N × close_timeout；
+        # shield 保证 stop() 本身被取消时关闭通知仍能送达
+        if self._clients:
+            payload = _json_dumps({
+                "type": "server_closing",
+                "message": "Server shutting down"
+            })
+            await asyncio.shield(asyncio.gather(
+                *(
+                    self._graceful_close(state.websocket, payload)
+                    for state in list(self._clients.values())
+                ),
+                return_exceptions=True,
+            ))
+        self._clients.clear()
+        self._expiry_heap.clear()
+        
+        # 关闭服务器
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        
+        logger.info("WebSocket 服务器已停止")
+
+    async def _graceful_close(self, websocket: WebSocketServerProtocol, payload: str):
+        """发送关闭通知并关闭单个连接（stop() 时并行执行）"""
+        try:
+            await websocket.send(payload)
+            await websocket.close(1001, "Server shutting down")
+        except Exception:
+            pass
+    
+    async def _handle_connection(self, websocket: WebSocketServerProtocol):
+        """
+        处理 WebSocket 连接
+        
+        支持两种连接方式：
+        1. ws://服务器IP:6190/ws/client?session_id=xxx&token=xxx (标准路径)
+        2. ws://服务器IP:6190?session_id=xxx&token=xxx (根路径兼容)
+        """
+        # 解析 URL 路径和参数（urlsplit 为 C 加速实现）
+        full_path = getattr(websocket, "path", "/")
+        parts = urlsplit(full_path)
+        path_part, query_string = parts.path, parts.query
+
+        # parse_qsl + dict：每个参数只有一个值，省去 parse_qs 的单元素列表包装
+        params = dict(parse_qsl(query_string))
+        
+        # 验证路径（支持 /ws/client 和 / 两种路径）
+        if path_part not in _VALID_PATHS:
+            logger.warning(f"WebSocket 连接拒绝: 无效路径 '{path_part}'，支持的路径: {sorted(_VALID_PATHS)}")
+            await websocket.close(1008, f"Invalid path: {path_part}")
+            return
+        
+        session_id = params.get("session_id")
+        token = params.get("token")
+        
+        # 重连风暴下每个连接都要做一次 token 打码拼接，级别未启用时直接跳过
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"收到 WebSocket 连接请求: path={path_part}, session_id={session_id}, token={'*' * 6 if token else 'None'}")
+        
+        # 验证参数
         if not session_id or not token:
             logger.warning("WebSocket 连接拒绝: 缺少 session_id 或 token")
             await websocket.close(1008, "Missing session_id or token")
@@ -274,305 +378,326 @@ class StandaloneWebSocketServer:
                 logger.error(f"WebSocket token 验证失败: {e}")
                 await websocket.close(1011, "Token validation error")
                 return
-        
-        # 记录连接和活跃时间
-        import time
-        self.connections[session_id] = websocket
-        self._last_activity[session_id] = time.time()
-        self._heartbeat_counts[session_id] = 0
-        self._total_connections += 1
-        logger.info(f"✅ 客户端已连接: session_id={session_id}，当前连接数: {len(self.connections)}")
-        
-        # 发送连接确认消息（包含完整的服务端配置）
-        await self._send_json(websocket, {
-            "type": "connection_status",
-            "status": "connected",
-            "session_id": session_id,
-            "server_time": time.time(),
-            "config": {
-                "ping_interval": self.PING_INTERVAL,
-                "ping_timeout": self.PING_TIMEOUT,
-                "health_check_interval": self.HEALTH_CHECK_INTERVAL,
-                "inactive_timeout": self.CLIENT_INACTIVE_TIMEOUT,
-                "server_ping_interval": self.SERVER_PING_INTERVAL,
-                "busy_state_timeout_extension": self.BUSY_STATE_TIMEOUT_EXTENSION,
-            }
-        })
-        
-        # 触发连接回调
-        if self.on_client_connect:
-            try:
-                result = self.on_client_connect(session_id)
-                if asyncio.iscoroutine(result):
-                    await result
-            except Exception as e:
-                logger.error(f"连接回调执行失败: {e}")
-        
-        try:
-            # 消息循环
-            async for message in websocket:
-                try:
-                    data = json.loads(message)
-                    await self._handle_message(session_id, websocket, data)
-                except json.JSONDecodeError:
-                    logger.warning(f"收到无效 JSON 消息: {message[:100]}...")
-                except Exception as e:
-                    logger.error(f"处理消息失败: {e}")
-                    logger.error(traceback.format_exc())
-                    
-        except ConnectionClosed as e:
-            # 区分正常关闭和异常关闭
-            if e.code == 1000:
-                logger.info(f"客户端正常断开: session_id={session_id}")
-            elif e.code == 1001:
-                logger.info(f"客户端正在离开: session_id={session_id}")
-            elif e.code == 1006:
-                logger.warning(f"客户端异常断开（网络问题）: session_id={session_id}")
-            else:
-                logger.info(f"客户端断开连接: session_id={session_id}, code={e.code}, reason={e.reason}")
-        except Exception as e:
-            logger.error(f"WebSocket 连接错误: {e}")
-            logger.error(traceback.format_exc())
-        finally:
-            # 清理连接和相关记录
-            self.connections.pop(session_id, None)
-            self._last_activity.pop(session_id, None)
-            self._heartbeat_counts.pop(session_id, None)
-            self._busy_states.pop(session_id, None)
-            self._total_disconnections += 1
-            logger.info(f"客户端已移除: session_id={session_id}，剩余连接数: {len(self.connections)}")
-            
-            # 触发断开回调
-            if self.on_client_disconnect:
-                try:
-                    result = self.on_client_disconnect(session_id)
-                    if asyncio.iscoroutine(result):
-                        await result
-                except Exception as e:
-                    logger.error(f"断开回调执行失败: {e}")
-    
-    async def _handle_message(
-        self,
-        session_id: str,
-        websocket: WebSocketServerProtocol,
-        data: dict
-    ):
-        """处理客户端消息"""
-        import time
-        msg_type = data.get("type", "")
-        
-        # 更新客户端活跃时间
-        self._last_activity[session_id] = time.time()
-        self._total_messages += 1
-        
-        # 心跳消息 - 立即响应
-        if msg_type == "heartbeat":
-            self._heartbeat_counts[session_id] = self._heartbeat_counts.get(session_id, 0) + 1
-            await self._send_json(websocket, {
-                "type": "heartbeat_ack",
-                "timestamp": time.time(),
-                "server_time": time.time(),
-                "heartbeat_count": self._heartbeat_counts[session_id]
-            })
-            return
-        
-        # 服务端 ping 的响应（server_pong）
-        if msg_type == "server_pong":
-            self._total_server_pongs += 1
-            client_timestamp = data.get("client_timestamp", 0)
-            latency = time.time() - client_timestamp if client_timestamp else 0
-            logger.debug(f"收到客户端 {session_id} 的 server_pong，延迟: {latency:.3f}s")
-            return
-        
-        # 忙碌状态报告 - 客户端正在执行长操作（如截图）
-        if msg_type == "busy_state":
-            is_busy = data.get("is_busy", False)
-            operation = data.get("operation", "unknown")
-            duration = data.get("duration", 30)  # 默认 30 秒
-            
-            if is_busy:
-                # 设置忙碌状态，延长超时时间
-                busy_until = time.time() + min(duration, self.BUSY_STATE_TIMEOUT_EXTENSION)
-                self._busy_states[session_id] = busy_until
-                logger.info(f"客户端 {session_id} 进入忙碌状态: {operation}，延长超时 {duration}s")
-            else:
-                # 清除忙碌状态
-                self._busy_states.pop(session_id, None)
-                logger.info(f"客户端 {session_id} 退出忙碌状态: {operation}")
-            
-            # 确认忙碌状态
-            await self._send_json(websocket, {
-                "type": "busy_state_ack",
-                "is_busy": is_busy,
-                "operation": operation,
-                "timestamp": time.time()
-            })
-            return
-        
-        # 配置请求 - 返回服务端配置
-        if msg_type == "get_config":
-            await self._send_json(websocket, {
-                "type": "server_config",
-                "config": {
-                    "ping_interval": self.PING_INTERVAL,
-                    "ping_timeout": self.PING_TIMEOUT,
-                    "health_check_interval": self.HEALTH_CHECK_INTERVAL,
-                    "inactive_timeout": self.CLIENT_INACTIVE_TIMEOUT,
-                    "server_ping_interval": self.SERVER_PING_INTERVAL,
-                    "busy_state_timeout_extension": self.BUSY_STATE_TIMEOUT_EXTENSION,
-                },
-                "server_time": time.time()
-            })
-            logger.debug(f"已向客户端 {session_id} 发送服务端配置")
-            return
-        
-        # 触发消息回调
-        if self.on_message:
-            try:
-                result = self.on_message(session_id, data)
-                if asyncio.iscoroutine(result):
-                    await result
-            except Exception as e:
-                logger.error(f"消息回调执行失败: {e}")
-                logger.error(traceback.format_exc())
-    
-    async def _health_check_loop(self):
-        """
-        健康检查循环
-        
-        定期检查所有连接的健康状态，清理死连接
-        """
-        import time
-        
-        while self._running:
-            try:
-                await asyncio.sleep(self.HEALTH_CHECK_INTERVAL)
-                
-                if not self._running:
-                    break
-                
-                current_time = time.time()
-                dead_connections = []
-                
-                # 检查所有连接
-                for session_id, ws in list(self.connections.items()):
-                    last_activity = self._last_activity.get(session_id, 0)
-                    inactive_time = current_time - last_activity
-                    
-                    # 检查客户端是否处于忙碌状态
-                    busy_until = self._busy_states.get(session_id, 0)
-                    is_busy = current_time < busy_until
-                    
-                    # 计算实际超时时间（忙碌状态下延长）
-                    effective_timeout = self.CLIENT_INACTIVE_TIMEOUT
-                    if is_busy:
-                        effective_timeout += self.BUSY_STATE_TIMEOUT_EXTENSION
-                    
-                    # 检查连接是否超时
-                    if inactive_time > effective_timeout:
-                        logger.warning(
-                            f"客户端 {session_id} 超时 ({inactive_time:.0f}s > {effective_timeout}s)，"
-                            f"忙碌状态: {is_busy}，心跳次数: {self._heartbeat_counts.get(session_id, 0)}，"
-                            f"标记为死连接"
-                        )
-                        dead_connections.append((session_id, "inactive_timeout"))
-                        continue
-                    
-                    # 检查 WebSocket 连接状态
-                    try:
-                        if hasattr(ws, 'open') and not ws.open:
-                            logger.warning(
-                                f"客户端 {session_id} WebSocket 已关闭，"
-                                f"最后活跃距今: {inactive_time:.1f}s，标记为死连接"
-                            )
-                            dead_connections.append((session_id, "websocket_closed"))
-                            continue
-                    except Exception as e:
-                        logger.warning(f"检查客户端 {session_id} 状态失败: {e}，标记为死连接")
-                        dead_connections.append((session_id, f"check_failed: {e}"))
-                        continue
-                    
-                    # 发送健康检查探测（可选，减少日志噪音）
-                    # 客户端会通过心跳响应来证明存活
-                
-                # 清理死连接
-                for session_id, reason in dead_connections:
-                    await self._cleanup_dead_connection(session_id, reason)
-                
-                # 输出健康状态摘要（仅在有连接时）
-                if self.connections:
-                    logger.debug(
-                        f"健康检查完成: 活跃连接 {len(self.connections)}，"
-                        f"清理死连接 {len(dead_connections)}，"
-                        f"总连接 {self._total_connections}，总断开 {self._total_disconnections}"
-                    )
-                    
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logger.error(f"健康检查异常: {e}")
-                logger.error(traceback.format_exc())
-    
-    async def _cleanup_dead_connection(self, session_id: str, reason: str = "unknown"):
-        """
-        清理死连接（带详细诊断日志）
-        
-        Args:
-            session_id: 要清理的客户端 session_id
-            reason: 清理原因
-        """
-        import time
-        
-        # 收集诊断信息
-        ws = self.connections.get(session_id)
-        last_activity = self._last_activity.get(session_id, 0)
-        heartbeat_count = self._heartbeat_counts.get(session_id, 0)
-        is_busy = session_id in self._busy_states
-        busy_until = self._busy_states.get(session_id, 0)
-        
-        # 详细的断开诊断日志
-        current_time = time.time()
-        logger.warning(
-            f"清理死连接: session_id={session_id}, "
-            f"原因={reason}, "
-            f"最后活跃距今={current_time - last_activity:.1f}s, "
-            f"心跳次数={heartbeat_count}, "
-            f"忙碌状态={is_busy}, "
-            f"忙碌剩余={max(0, busy_until - current_time):.1f}s, "
-            f"连接对象存在={ws is not None}, "
-            f"连接打开状态={getattr(ws, 'open', 'N/A') if ws else 'N/A'}"
-        )
-        
-        if ws:
-            try:
-                # 尝试发送关闭通知
-                await self._send_json(ws, {
-                    "type": "connection_timeout",
-                    "message": f"Connection closed: {reason}"
-                })
-                await ws.close(1000, f"Connection cleanup: {reason}")
-            except Exception as e:
-                logger.debug(f"关闭死连接 {session_id} 失败（可能已断开）: {e}")
-        
-        # 清理记录
-        self.connections.pop(session_id, None)
-        self._last_activity.pop(session_id, None)
-        self._heartbeat_counts.pop(session_id, None)
-        self._busy_states.pop(session_id, None)
-        self._total_disconnections += 1
-        
-        # 触发断开回调
-        if self.on_client_disconnect:
-            try:
-                result = self.on_client_disconnect(session_id)
-                if asyncio.iscoroutine(result):
-                    await result
-            except Exception as e:
-                logger.error(f"断开回调执行失败: {e}")
-        
-        logger.info(f"已清理死连接: session_id={session_id}, 剩余连接数: {len(self.connections)}")
-    
-    async def send_to_client(self, session_id: str, data: dict) -> bool:
+        
+        # 创建发送队列、专属写任务，并集中记录客户端状态
+        # （活跃时间用单调时钟，不受系统时间调整影响）
+        out_queue: asyncio.Queue = asyncio.Queue(maxsize=self.SEND_QUEUE_MAXSIZE)
+        writer_task = asyncio.create_task(
+            self._writer_loop(session_id, websocket, out_queue)
+        )
+        state = _ClientState(websocket, out_queue, writer_task)
+        self._clients[session_id] = state
+        heapq.heappush(
+            self._expiry_heap,
+            (state.last_activity + self.CLIENT_INACTIVE_TIMEOUT, session_id, state.epoch),
+        )
+        self._total_connections += 1
+        logger.info(f"✅ 客户端已连接: session_id={session_id}，当前连接数: {len(self._clients)}")
+        
+        # 发送连接确认消息（包含完整的服务端配置）
+        self._enqueue(session_id, _json_dumps({
+            "type": "connection_status",
+            "status": "connected",
+            "session_id": session_id,
+            "server_time": time.time(),
+            "config": {
+                "ping_interval": self.PING_INTERVAL,
+                "ping_timeout": self.PING_TIMEOUT,
+                "health_check_interval": self.HEALTH_CHECK_INTERVAL,
+                "inactive_timeout": self.CLIENT_INACTIVE_TIMEOUT,
+                "server_ping_interval": self.SERVER_PING_INTERVAL,
+                "busy_state_timeout_extension": self.BUSY_STATE_TIMEOUT_EXTENSION,
+            }
+        }))
+
+        # 触发连接回调
+        if self._dispatch_connect:
+            try:
+                await self._dispatch_connect(session_id)
+            except Exception as e:
+                logger.error(f"连接回调执行失败: {e}")
+        
+        try:
+            # 消息循环
+            async for message in websocket:
+                try:
+                    # 二进制帧（截图字节）不经过 JSON 解析，直接分发
+                    if isinstance(message, (bytes, bytearray)):
+                        await self._handle_message(session_id, websocket, {
+                            "type": "binary_frame",
+                            "data": bytes(message),
+                        })
+                        continue
+                    data = _json_loads(message)
+                    await self._handle_message(session_id, websocket, data)
+                except ValueError:
+                    logger.warning(f"收到无效 JSON 消息: {message[:100]}...")
+                except Exception as e:
+                    logger.error(f"处理消息失败: {e}")
+                    logger.error(traceback.format_exc())
+                    
+        except ConnectionClosed as e:
+            # 区分正常关闭和异常关闭
+            if e.code == 1000:
+                logger.info(f"客户端正常断开: session_id={session_id}")
+            elif e.code == 1001:
+                logger.info(f"客户端正在离开: session_id={session_id}")
+            elif e.code == 1006:
+                logger.warning(f"客户端异常断开（网络问题）: session_id={session_id}")
+            else:
+                logger.info(f"客户端断开连接: session_id={session_id}, code={e.code}, reason={e.reason}")
+        except Exception as e:
+            logger.error(f"WebSocket 连接错误: {e}")
+            logger.error(traceback.format_exc())
+        finally:
+            # 清理连接和相关记录
+            self._remove_session(session_id)
+            logger.info(f"客户端已移除: session_id={session_id}，剩余连接数: {len(self._clients)}")
+            
+            # 触发断开回调
+            if self._dispatch_disconnect:
+                try:
+                    await self._dispatch_disconnect(session_id)
+                except Exception as e:
+                    logger.error(f"断开回调执行失败: {e}")
+    
+    async def _handle_message(
+        self,
+        session_id: str,
+        websocket: WebSocketServerProtocol,
+        data: dict
+    ):
+        """处理客户端消息"""
+        msg_type = data.get("type", "")
+        now = time.time()
+        state = self._clients.get(session_id)
+
+        # 更新客户端活跃时间（单调时钟），并为新的到期时间压入堆条目；
+        # 旧条目不删除，靠 epoch 失效，弹出时再跳过
+        if state is not None:
+            mono_now = time.monotonic()
+            state.last_activity = mono_now
+            state.epoch += 1
+            heapq.heappush(
+                self._expiry_heap,
+                (mono_now + self.CLIENT_INACTIVE_TIMEOUT, session_id, state.epoch),
+            )
+        self._total_messages += 1
+        
+        # 服务级消息走 O(1) 派发表（见类末尾的 _HANDLERS），
+        # 未命中的消息类型交给上层消息回调
+        handler = self._HANDLERS.get(msg_type)
+        if handler is not None:
+            await handler(self, session_id, state, now, data)
+            return
+        
+        # 触发消息回调
+        if self._dispatch_message:
+            try:
+                await self._dispatch_message(session_id, data)
+            except Exception as e:
+                logger.error(f"消息回调执行失败: {e}")
+                logger.error(traceback.format_exc())
+    
+    async def _on_heartbeat(self, session_id: str, state, now: float, data: dict):
+        """心跳消息 - 立即响应
+        
+        应答结构固定，只有时间戳和计数在变：直接按模板拼接 JSON，
+        省去最热路径上的 dict 构造和通用序列化开销。
+        """
+        if state is not None:
+            state.heartbeat_count += 1
+        count = state.heartbeat_count if state else 0
+        self._enqueue(
+            session_id,
+            f'{{"type":"heartbeat_ack","timestamp":{now!r},"server_time":{now!r},"heartbeat_count":{count}}}',
+        )
+    
+    async def _on_server_pong(self, session_id: str, state, now: float, data: dict):
+        """服务端 ping 的响应（server_pong）"""
+        self._total_server_pongs += 1
+        client_timestamp = data.get("client_timestamp", 0)
+        latency = now - client_timestamp if client_timestamp else 0
+        logger.debug(f"收到客户端 {session_id} 的 server_pong，延迟: {latency:.3f}s")
+    
+    async def _on_busy_state(self, session_id: str, state, now: float, data: dict):
+        """忙碌状态报告 - 客户端正在执行长操作（如截图）"""
+        is_busy = data.get("is_busy", False)
+        operation = data.get("operation", "unknown")
+        duration = data.get("duration", 30)  # 默认 30 秒
+        
+        if is_busy:
+            # 设置忙碌状态，延长超时时间
+            if state is not None:
+                state.busy_until = time.monotonic() + min(duration, self.BUSY_STATE_TIMEOUT_EXTENSION)
+            logger.info(f"客户端 {session_id} 进入忙碌状态: {operation}，延长超时 {duration}s")
+        else:
+            # 清除忙碌状态
+            if state is not None:
+                state.busy_until = 0.0
+            logger.info(f"客户端 {session_id} 退出忙碌状态: {operation}")
+        
+        # 确认忙碌状态
+        self._enqueue(session_id, _json_dumps({
+            "type": "busy_state_ack",
+            "is_busy": is_busy,
+            "operation": operation,
+            "timestamp": now
+        }))
+    
+    async def _on_get_config(self, session_id: str, state, now: float, data: dict):
+        """配置请求 - 返回服务端配置"""
+        self._enqueue(session_id, _json_dumps({
+            "type": "server_config",
+            "config": {
+                "ping_interval": self.PING_INTERVAL,
+                "ping_timeout": self.PING_TIMEOUT,
+                "health_check_interval": self.HEALTH_CHECK_INTERVAL,
+                "inactive_timeout": self.CLIENT_INACTIVE_TIMEOUT,
+                "server_ping_interval": self.SERVER_PING_INTERVAL,
+                "busy_state_timeout_extension": self.BUSY_STATE_TIMEOUT_EXTENSION,
+            },
+            "server_time": now
+        }))
+        logger.debug(f"已向客户端 {session_id} 发送服务端配置")
+    
+    # 服务级消息派发表：哈希查找替代逐条 if/elif 比较
+    _HANDLERS = {
+        "heartbeat": _on_heartbeat,
+        "server_pong": _on_server_pong,
+        "busy_state": _on_busy_state,
+        "get_config": _on_get_config,
+    }
+    
+    async def _health_check_loop(self):
+        """
+        健康检查循环
+        
+        定期检查所有连接的健康状态，清理死连接
+        """
+        # 按单调时钟推进截止时间：本轮清理耗时不会顺延后续轮次（无漂移）
+        next_deadline = time.monotonic() + self.HEALTH_CHECK_INTERVAL
+        while self._running:
+            try:
+                await asyncio.sleep(max(0.0, next_deadline - time.monotonic()))
+                next_deadline += self.HEALTH_CHECK_INTERVAL
+                
+                if not self._running:
+                    break
+                
+                current_time = time.monotonic()
+                dead_connections = []
+                
+                # 只处理到期堆中 deadline 已过的条目，空闲连接不产生任何开销
+                heap = self._expiry_heap
+                while heap and heap[0][0] <= current_time:
+                    _, session_id, epoch = heapq.heappop(heap)
+                    state = self._clients.get(session_id)
+                    
+                    # 失效条目：客户端已断开，或之后又活跃过（epoch 已递增）
+                    if state is None or epoch != state.epoch:
+                        continue
+                    
+                    # 按当前忙碌状态重算真实截止时间，未真正超时则压回修正后的条目
+                    is_busy = current_time < state.busy_until
+                    effective_timeout = self.CLIENT_INACTIVE_TIMEOUT
+                    if is_busy:
+                        effective_timeout += self.BUSY_STATE_TIMEOUT_EXTENSION
+                    actual_deadline = state.last_activity + effective_timeout
+                    if actual_deadline > current_time:
+                        heapq.heappush(heap, (actual_deadline, session_id, epoch))
+                        continue
+                    
+                    inactive_time = current_time - state.last_activity
+                    logger.warning(
+                        f"客户端 {session_id} 超时 ({inactive_time:.0f}s > {effective_timeout}s)，"
+                        f"忙碌状态: {is_busy}，心跳次数: {state.heartbeat_count}，"
+                        f"标记为死连接"
+                    )
+                    dead_connections.append((session_id, "inactive_timeout"))
+                
+                # 并行清理死连接：逐个 await 时，一个卡在 close 超时的连接
+                # 会拖慢整轮健康检查
+                if dead_connections:
+                    await asyncio.gather(
+                        *(
+                            self._cleanup_dead_connection(session_id, reason)
+                            for session_id, reason in dead_connections
+                        ),
+                        return_exceptions=True,
+                    )
+                
+                # 输出健康状态摘要（仅在有连接时）
+                if self._clients:
+                    logger.debug(
+                        f"健康检查完成: 活跃连接 {len(self._clients)}，"
+                        f"清理死连接 {len(dead_connections)}，"
+                        f"总连接 {self._total_connections}，总断开 {self._total_disconnections}"
+                    )
+                    
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"健康检查异常: {e}")
+                logger.error(traceback.format_exc())
+    
+    async def _cleanup_dead_connection(self, session_id: str, reason: str = "unknown"):
+        """
+        清理死连接（带详细诊断日志）
+        
+        Args:
+            session_id: 要清理的客户端 session_id
+            reason: 清理原因
+        """
+        # 收集诊断信息
+        state = self._clients.get(session_id)
+        ws = state.websocket if state else None
+        last_activity = state.last_activity if state else 0
+        heartbeat_count = state.heartbeat_count if state else 0
+        busy_until = state.busy_until if state else 0
+        
+        # 详细的断开诊断日志
+        current_time = time.monotonic()
+        is_busy = current_time < busy_until
+        logger.warning(
+            f"清理死连接: session_id={session_id}, "
+            f"原因={reason}, "
+            f"最后活跃距今={current_time - last_activity:.1f}s, "
+            f"心跳次数={heartbeat_count}, "
+            f"忙碌状态={is_busy}, "
+            f"忙碌剩余={max(0, busy_until - current_time):.1f}s, "
+            f"连接对象存在={ws is not None}, "
+            f"连接打开状态={getattr(ws, 'open', 'N/A') if ws else 'N/A'}, "
+            f"协议层延迟={getattr(ws, 'latency', 'N/A') if ws else 'N/A'}"
+        )
+        
+        # 先停掉写任务，关闭通知走直接发送（连接即将关闭，无需排队）
+        self._teardown_writer(session_id)
+
+        if ws:
+            try:
+                # 尝试发送关闭通知
+                await self._send_json(ws, {
+                    "type": "connection_timeout",
+                    "message": f"Connection closed: {reason}"
+                })
+                await ws.close(1000, f"Connection cleanup: {reason}")
+            except Exception as e:
+                logger.debug(f"关闭死连接 {session_id} 失败（可能已断开）: {e}")
+        
+        # 清理记录（写任务已在上面停掉，_remove_session 再调一次是幂等的）
+        self._remove_session(session_id)
+        
+        # 触发断开回调
+        if self._dispatch_disconnect:
+            try:
+                await self._dispatch_disconnect(session_id)
+            except Exception as e:
+                logger.error(f"断开回调执行失败: {e}")
+        
+        logger.info(f"已清理死连接: session_id={session_id}, 剩余连接数: {len(self._clients)}")
+    
+    async def send_to_client(self, session_id: str, data: dict) -> bool:
         """
         发送消息给指定客户端
         
@@ -584,216 +709,314 @@ class StandaloneWebSocketServer:
             是否发送成功
         """
         # 调试日志：打印当前所有连接
-        logger.debug(f"[发送调试] 尝试发送到 session_id={session_id}, 当前连接数={len(self.connections)}, 连接列表={list(self.connections.keys())}")
+        logger.debug(f"[发送调试] 尝试发送到 session_id={session_id}, 当前连接数={len(self._clients)}, 连接列表={list(self._clients.keys())}")
+        
+        if session_id not in self._clients:
+            logger.warning(f"发送失败: 客户端未连接 session_id={session_id}, 当前连接={list(self._clients.keys())}")
+            return False
+
+        # 入队后由客户端专属写任务发送，慢客户端不会阻塞调用方
+        return self._enqueue(session_id, _json_dumps(data))
+    
+    async def broadcast(self, data: dict) -> int:
+        """
+        广播消息给所有客户端
+        
+        Args:
+            data: 要发送的数据（字典）
+            
+        Returns:
+            成功发送的客户端数量
+        """
+        success_count = 0
+        failed_sessions = []
+
+        # 只序列化一次，N 个客户端共用同一份载荷。
+        # serve() 已禁用 permessage-deflate，广播不会被逐客户端重复压缩；
+        # 桌面端消息多为 1KB 以内的状态通知，压缩收益抵不上协商和 CPU 成本
+        payload = _json_dumps(data)
+
+        # 优先走库自带的 websockets.broadcast：同步写入各连接的传输缓冲，
+        # 不逐客户端 await、无队头阻塞；写失败的连接由库内部忽略，
+        # 最终由接收循环 / 健康检查完成清理
+        if _ws_broadcast is not None:
+            _ws_broadcast(
+                (state.websocket for state in self._clients.values()),
+                payload,
+            )
+            return len(self._clients)
+
+        # 回退：入队即返回，实际发送由各客户端的专属写任务并行完成，
+        # 慢客户端只影响自己的队列，不会阻塞广播调用方
+        # 只快照键（tuple 比 (key, value) 列表省一半分配），值在循环内按需取
+        for session_id in tuple(self._clients):
+            if self._enqueue(session_id, payload):
+                success_count += 1
+            else:
+                failed_sessions.append(session_id)
+        
+        # 清理发送失败的连接（完整清理所有状态）
+        for session_id in failed_sessions:
+            state = self._clients.get(session_id)
+            last_activity = state.last_activity if state else 0
+            heartbeat_count = state.heartbeat_count if state else 0
+            pending_requests = len([r for r in getattr(self, '_pending_requests', {}).values()
+                                   if getattr(r, 'session_id', None) == session_id])
+            
+            logger.warning(
+                f"广播发送失败，清理连接: session_id={session_id}, "
+                f"最后活跃距今={time.monotonic() - last_activity:.1f}s, "
+                f"心跳次数={heartbeat_count}, "
+                f"待处理请求={pending_requests}"
+            )
+            
+            # 完整清理所有相关状态
+            self._remove_session(session_id)
+            
+            # 触发断开回调
+            if self._dispatch_disconnect:
+                try:
+                    await self._dispatch_disconnect(session_id)
+                except Exception as e:
+                    logger.error(f"广播清理时断开回调执行失败: {e}")
+        
+        return success_count
+    
+    async def _writer_loop(
+        self,
+        session_id: str,
+        websocket: WebSocketServerProtocol,
+        queue: asyncio.Queue,
+    ):
+        """
+        客户端专属写循环
+
+        从发送队列取出消息并逐条发送。发送失败说明连接已失效，
+        退出循环并交由接收循环 / 健康检查完成清理。
+        """
+        try:
+            while True:
+                payload = await queue.get()
+                try:
+                    await websocket.send(payload)
+                except Exception as e:
+                    logger.debug(f"写任务发送失败，退出: session_id={session_id}, error={e}")
+                    break
+        except asyncio.CancelledError:
+            pass
+
+    def _enqueue(self, session_id: str, payload: str) -> bool:
+        """
+        将已序列化的消息放入客户端发送队列
+
+        队列满说明客户端消费过慢，丢弃最旧的一条消息为新消息腾位
+        （桌面助手的消息以状态类为主，旧状态本就应被新状态覆盖）。
+
+        Returns:
+            是否入队成功（客户端未连接时返回 False）
+        """
+        state = self._clients.get(session_id)
+        if state is None or state.out_queue is None:
+            return False
+        queue = state.out_queue
+        try:
+            queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            logger.warning(f"客户端 {session_id} 发送队列已满，丢弃最旧消息")
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+            try:
+                queue.put_nowait(payload)
+                return True
+            except asyncio.QueueFull:
+                return False
+
+    def _remove_session(self, session_id: str):
+        """
+        移除客户端的全部状态并计入断开统计
+
+        所有断开路径（接收循环退出、死连接清理、广播失败）统一走这里，
+        避免某条路径漏掉一部分状态造成泄漏。
+        """
+        self._teardown_writer(session_id)
+        self._clients.pop(session_id, None)
+        self._total_disconnections += 1
+
+    def _teardown_writer(self, session_id: str):
+        """取消客户端写任务并丢弃其发送队列"""
+        state = self._clients.get(session_id)
+        if state is None:
+            return
+        if state.writer_task is not None:
+            state.writer_task.cancel()
+            state.writer_task = None
+        state.out_queue = None
+
+    async def _send_json(self, websocket: WebSocketServerProtocol, data: dict) -> bool:
+        """发送 JSON 数据（单客户端路径）"""
+        return await self._send_raw(websocket, _json_dumps(data))
+
+    async def _send_raw(self, websocket: WebSocketServerProtocol, payload: str) -> bool:
+        """发送已序列化的载荷（广播路径复用同一份序列化结果）"""
+        try:
+            await websocket.send(payload)
+            return True
+        except Exception as e:
+            # 记录详细的发送失败信息
+            session_id = self._find_session_by_websocket(websocket)
+            logger.error(f"发送消息失败: session_id={session_id}, error={e}")
+            return False
+    
+    def _find_session_by_websocket(self, websocket: WebSocketServerProtocol) -> Optional[str]:
+        """通过 websocket 对象查找 session_id"""
+        for session_id, state in self._clients.items():
+            if state.websocket is websocket:
+                return session_id
+        return None
+    
+    def is_client_connected(self, session_id: str) -> bool:
+        """
+        检查客户端是否已连接且活跃
+        
+        Args:
+            session_id: 客户端 session_id
+            
+        Returns:
+            客户端是否连接且活跃
+        """
+        state = self._clients.get(session_id)
+        if state is None:
+            return False
         
-        websocket = self.connections.get(session_id)
-        if not websocket:
-            logger.warning(f"发送失败: 客户端未连接 session_id={session_id}, 当前连接={list(self.connections.keys())}")
+        ws = state.websocket
+        # 检查 WebSocket 连接状态
+        if ws is None:
             return False
         
-        return await self._send_json(websocket, data)
-    
-    async def broadcast(self, data: dict) -> int:
-        """
-        广播消息给所有客户端
-        
-        Args:
-            data: 要发送的数据（字典）
-            
-        Returns:
-            成功发送的客户端数量
-        """
-        import time
-        success_count = 0
-        failed_sessions = []
-        
-        for session_id, websocket in list(self.connections.items()):
-            if await self._send_json(websocket, data):
-                success_count += 1
-            else:
-                # 发送失败，记录需要清理的连接
-                failed_sessions.append(session_id)
-        
-        # 清理发送失败的连接（完整清理所有状态）
-        for session_id in failed_sessions:
-            last_activity = self._last_activity.get(session_id, 0)
-            heartbeat_count = self._heartbeat_counts.get(session_id, 0)
-            pending_requests = len([r for r in getattr(self, '_pending_requests', {}).values()
-                                   if getattr(r, 'session_id', None) == session_id])
-            
-            logger.warning(
-                f"广播发送失败，清理连接: session_id={session_id}, "
-                f"最后活跃距今={time.time() - last_activity:.1f}s, "
-                f"心跳次数={heartbeat_count}, "
-                f"待处理请求={pending_requests}"
-            )
-            
-            # 完整清理所有相关状态
-            self.connections.pop(session_id, None)
-            self._last_activity.pop(session_id, None)
-            self._heartbeat_counts.pop(session_id, None)
-            self._busy_states.pop(session_id, None)
-            self._total_disconnections += 1
-            
-            # 触发断开回调
-            if self.on_client_disconnect:
-                try:
-                    result = self.on_client_disconnect(session_id)
-                    if asyncio.iscoroutine(result):
-                        await result
-                except Exception as e:
-                    logger.error(f"广播清理时断开回调执行失败: {e}")
-        
-        return success_count
-    
-    async def _send_json(self, websocket: WebSocketServerProtocol, data: dict) -> bool:
-        """发送 JSON 数据"""
-        try:
-            await websocket.send(json.dumps(data, ensure_ascii=False))
-            return True
-        except Exception as e:
-            # 记录详细的发送失败信息
-            session_id = self._find_session_by_websocket(websocket)
-            logger.error(f"发送消息失败: session_id={session_id}, error={e}")
-            return False
-    
-    def _find_session_by_websocket(self, websocket: WebSocketServerProtocol) -> Optional[str]:
-        """通过 websocket 对象查找 session_id"""
-        for session_id, ws in self.connections.items():
-            if ws is websocket:
-                return session_id
-        return None
-    
-    def is_client_connected(self, session_id: str) -> bool:
-        """
-        检查客户端是否已连接且活跃
-        
-        Args:
-            session_id: 客户端 session_id
-            
-        Returns:
-            客户端是否连接且活跃
-        """
-        if session_id not in self.connections:
-            return False
-        
-        ws = self.connections[session_id]
-        # 检查 WebSocket 连接状态
-        if ws is None:
-            return False
-        
-        # 检查连接是否仍然打开
-        try:
-            return ws.open if hasattr(ws, 'open') else True
-        except Exception:
-            return False
-    
-    def get_client_last_activity(self, session_id: str) -> float:
-        """
-        获取客户端最后活跃时间
-        
-        Args:
-            session_id: 客户端 session_id
-            
-        Returns:
-            最后活跃时间戳，如果不存在返回 0
-        """
-        return self._last_activity.get(session_id, 0)
-    
-    def get_server_stats(self) -> dict:
-        """
-        获取服务器统计信息
-        
-        Returns:
-            包含连接统计的字典
-        """
-        import time
-        current_time = time.time()
-        
-        # 计算每个连接的活跃时间
-        connection_details = {}
-        for session_id in self.connections:
-            last_activity = self._last_activity.get(session_id, 0)
-            heartbeat_count = self._heartbeat_counts.get(session_id, 0)
-            connection_details[session_id] = {
-                "inactive_seconds": current_time - last_activity if last_activity else None,
-                "heartbeat_count": heartbeat_count
-            }
-        
-        return {
-            "is_running": self._running,
-            "active_connections": len(self.connections),
-            "total_connections": self._total_connections,
-            "total_disconnections": self._total_disconnections,
-            "total_messages": self._total_messages,
-            "connection_details": connection_details
-        }
-    
-    async def _server_ping_loop(self):
-        """
-        服务端主动探测循环
-        
-        定期向所有客户端发送 server_ping，检测连接活性
-        """
-        import time
-        
-        while self._running:
-            try:
-                await asyncio.sleep(self.SERVER_PING_INTERVAL)
-                
-                if not self._running:
-                    break
-                
-                current_time = time.time()
-                
-                # 向所有连接的客户端发送 server_ping
-                for session_id, ws in list(self.connections.items()):
-                    try:
-                        if hasattr(ws, 'open') and ws.open:
-                            await self._send_json(ws, {
-                                "type": "server_ping",
-                                "timestamp": current_time,
-                                "server_time": current_time
-                            })
-                            self._total_server_pings += 1
-                    except Exception as e:
-                        logger.debug(f"向客户端 {session_id} 发送 server_ping 失败: {e}")
-                
-                # 输出探测摘要（仅在有连接时）
-                if self.connections:
-                    logger.debug(
-                        f"服务端探测: 发送 {len(self.connections)} 个 ping，"
-                        f"总计发送 {self._total_server_pings}，收到响应 {self._total_server_pongs}"
-                    )
-                    
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logger.error(f"服务端探测循环异常: {e}")
-    
-    async def ping_client(self, session_id: str) -> bool:
-        """
-        主动 ping 指定客户端
-        
-        Args:
-            session_id: 客户端 session_id
-            
-        Returns:
-            是否发送成功
-        """
-        import time
-        ws = self.connections.get(session_id)
-        if not ws:
-            return False
-        
-        try:
-            await self._send_json(ws, {
-                "type": "server_ping",
-                "timestamp": time.time(),
-                "server_time": time.time()
-            })
-            self._total_server_pings += 1
-            return True
-        except Exception as e:
-            logger.error(f"Ping 客户端 {session_id} 失败: {e}")
-            return False
+        # 检查连接是否仍然打开
+        try:
+            return ws.open if hasattr(ws, 'open') else True
+        except Exception:
+            return False
+    
+    def get_client_last_activity(self, session_id: str) -> float:
+        """
+        获取客户端最后活跃时间
+        
+        Args:
+            session_id: 客户端 session_id
+            
+        Returns:
+            最后活跃时间戳，如果不存在返回 0
+        """
+        state = self._clients.get(session_id)
+        if state is None:
+            return 0
+        mono = state.last_activity
+        # 内部用单调时钟记录，对外换算回墙上时钟时间戳
+        return time.time() - (time.monotonic() - mono)
+    
+    def get_server_stats(self) -> dict:
+        """
+        获取服务器统计信息
+        
+        Returns:
+            包含连接统计的字典
+        """
+        current_time = time.monotonic()
+        
+        # 计算每个连接的活跃时间
+        # latency 来自 websockets 协议层 ping/pong（C 实现），比应用层心跳测得更准
+        connection_details = {}
+        for session_id, state in self._clients.items():
+            connection_details[session_id] = {
+                "inactive_seconds": current_time - state.last_activity if state.last_activity else None,
+                "heartbeat_count": state.heartbeat_count,
+                "latency": getattr(state.websocket, "latency", None)
+            }
+        
+        return {
+            "is_running": self._running,
+            "active_connections": len(self._clients),
+            "total_connections": self._total_connections,
+            "total_disconnections": self._total_disconnections,
+            "total_messages": self._total_messages,
+            "connection_details": connection_details
+        }
+    
+    async def _server_ping_loop(self):
+        """
+        服务端主动探测循环
+        
+        定期向所有客户端发送 server_ping，检测连接活性
+        """
+        # 与健康检查相同的无漂移节拍
+        next_deadline = time.monotonic() + self.SERVER_PING_INTERVAL
+        while self._running:
+            try:
+                await asyncio.sleep(max(0.0, next_deadline - time.monotonic()))
+                next_deadline += self.SERVER_PING_INTERVAL
+                
+                if not self._running:
+                    break
+                
+                current_time = time.time()
+                
+                # 向所有连接的客户端发送 server_ping（只快照键，回调期间可能有断开）
+                for session_id in tuple(self._clients):
+                    state = self._clients.get(session_id)
+                    if state is None:
+                        continue
+                    ws = state.websocket
+                    try:
+                        if hasattr(ws, 'open') and ws.open:
+                            self._enqueue(session_id, _json_dumps({
+                                "type": "server_ping",
+                                "timestamp": current_time,
+                                "server_time": current_time
+                            }))
+                            self._total_server_pings += 1
+                    except Exception as e:
+                        logger.debug(f"向客户端 {session_id} 发送 server_ping 失败: {e}")
+                
+                # 输出探测摘要（仅在有连接时）
+                if self._clients:
+                    logger.debug(
+                        f"服务端探测: 发送 {len(self._clients)} 个 ping，"
+                        f"总计发送 {self._total_server_pings}，收到响应 {self._total_server_pongs}"
+                    )
+                    
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"服务端探测循环异常: {e}")
+    
+    async def ping_client(self, session_id: str) -> bool:
+        """
+        主动 ping 指定客户端
+        
+        Args:
+            session_id: 客户端 session_id
+            
+        Returns:
+            是否发送成功
+        """
+        state = self._clients.get(session_id)
+        if state is None:
+            return False
+        ws = state.websocket
+        
+        try:
+            await self._send_json(ws, {
+                "type": "server_ping",
+                "timestamp": time.time(),
+                "server_time": time.time()
+            })
+            self._total_server_pings += 1
+            return True
+        except Exception as e:
+            logger.error(f"Ping 客户端 {session_id} 失败: {e}")
+            return False